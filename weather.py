@@ -1,163 +1,253 @@
-from typing import Any
+from collections.abc import AsyncIterator
+from contextlib import asynccontextmanager
+from typing import Any, Literal, get_args
+import asyncio
 import httpx
 import json
+import logging
+import time
 from mcp.server.fastmcp import FastMCP
 
+try:
+    import orjson
+except ImportError:
+    orjson = None
 
-# Initialize FastMCP server
-mcp = FastMCP("weather", log_level = "ERROR")
+
+logger = logging.getLogger(__name__)
 
 # Constants
 HKO_API_BASE = "https://data.weather.gov.hk/weatherAPI/opendata/weather.php"
 USER_AGENT = "weather-app/1.0"
+DataType = Literal["flw", "fnd", "rhrread", "warnsum", "warningInfo", "swt"]
+Lang = Literal["en", "tc", "sc"]
+_DATATYPES = frozenset(get_args(DataType))
+_LANGS = frozenset(get_args(Lang))
+_URLS = {(dt, lg): f"{HKO_API_BASE}?dataType={dt}&lang={lg}" for dt in _DATATYPES for lg in _LANGS}
+
+# Seconds a formatted response stays fresh, per dataType
+_TTL = {
+    "rhrread": 60,
+    "flw": 600,
+    "fnd": 600,
+    "warnsum": 30,
+    "warningInfo": 30,
+    "swt": 120
+}
+
+# Formatted responses keyed by (dataType, lang), stored as (fetched_at, result)
+_CACHE: dict[tuple[str, str], tuple[float, str]] = {}
+
+# Fetches currently in progress, so concurrent misses for a key share one request
+_INFLIGHT: dict[tuple[str, str], asyncio.Task[str]] = {}
+
+# Shared HTTP client, reused across tool calls so the connection to HKO stays alive
+_CLIENT: httpx.AsyncClient | None = None
+
+# Caps how many requests to HKO can be open at once
+_HKO_SEM = asyncio.Semaphore(8)
+
+async def _get_client() -> httpx.AsyncClient:
+    """Return the shared HKO client, creating it on first use"""
+    global _CLIENT
+    if _CLIENT is None:
+        _CLIENT = httpx.AsyncClient(
+            http2=True,
+            headers={
+                "User-Agent": USER_AGENT,
+                "Accept": "application/json",
+                "Accept-Encoding": "br, gzip"
+            },
+            timeout=httpx.Timeout(30.0),
+            limits=httpx.Limits(max_keepalive_connections=10, max_connections=20)
+        )
+    return _CLIENT
+
+@asynccontextmanager
+async def lifespan(server: FastMCP) -> AsyncIterator[None]:
+    """Close the shared HKO client when the server shuts down"""
+    global _CLIENT
+    try:
+        yield
+    finally:
+        if _CLIENT is not None:
+            await _CLIENT.aclose()
+            _CLIENT = None
+
+
+# Initialize FastMCP server
+mcp = FastMCP("weather", log_level = "ERROR", lifespan=lifespan)
 
 async def make_hko_weather_request(url: str) -> dict[str, Any] | None:
     """Make a request to HKO API with proper error handling"""
-    headers = {
-        "User-Agent": USER_AGENT,
-        "Accept": "application/json"
-    }
-    async with httpx.AsyncClient() as client:
-        try: 
-            response = await client.get(url, headers=headers, timeout= 30.0)
-            response.raise_for_status()
-            return response.json()
-        except httpx.HTTPStatusError as e:
-            print(f"HTTP error: {e.response.status_code} - {e}")
-            return None
-        except httpx.RequestError as e:
-            print(f"Request error: {e}")
-            return None
-        except Exception as e:
-            print(f"Unexpected error: {e}")
-            return None
+    client = await _get_client()
+    try: 
+        async with _HKO_SEM:
+            response = await client.get(url)
+        response.raise_for_status()
+        if orjson is not None:
+            return orjson.loads(response.content)
+        return json.loads(response.content)
+    except httpx.HTTPStatusError as e:
+        logger.warning("HTTP error: %s - %s", e.response.status_code, e)
+        return None
+    except httpx.RequestError as e:
+        logger.warning("Request error: %s", e)
+        return None
+    except Exception as e:
+        logger.exception("Unexpected error: %s", e)
+        return None
+
+# Warning statement codes used by the warningInfo endpoint
+_WARNING_CODES = {
+    "WFIRE": "Fire Danger Warning",
+    "WFROST" : "Frost Warning",
+    "WHOT": "Hot Weather Warning",
+    "WCOLD": "Cold Weather Warning",
+    "WMSGNL": "Strong Monsoon Signal",
+    "WTCPRE8": "Pre-no.8 Special Announcement",
+    "WRAIN": "Rainstorm Warning Signal",
+    "WFNTSA": "Special Announcement on Flooding in the northern New Territories",
+    "WL": "Landslip Warning",
+    "WTCSGNL": "Tropical Cyclone Warning Signal",
+    "WTMW": "Tsunami Warning",
+    "WTS": "Thunderstorm Warning"
+}
 
 def format_warnings(data):
     if not data.get('details'):
         return "No active warnings"
     
-    warnings = []
-    warning_code_dict = {
-        "WFIRE": "Fire Danger Warning",
-        "WFROST" : "Frost Warning",
-        "WHOT": "Hot Weather Warning",
-        "WCOLD": "Cold Weather Warning",
-        "WMSGNL": "Strong Monsoon Signal",
-        "WTCPRE8": "Pre-no.8 Special Announcement",
-        "WRAIN": "Rainstorm Warning Signal",
-        "WFNTSA": "Special Announcement on Flooding in the northern New Territories",
-        "WL": "Landslip Warning",
-        "WTCSGNL": "Tropical Cyclone Warning Signal",
-        "WTMW": "Tsunami Warning",
-        "WTS": "Thunderstorm Warning"
-    }
-    for warning in data['details']:
-        code = warning_code_dict[warning['warningStatementCode']]
-        subtype = f" ({warning['subtype']})" if warning.get('subtype') else ''
-        time = warning['updateTime']
-        content = ' '.join(warning['contents'])
-        
-        warnings.append(f"{code}{subtype} - {time}: {content}")
-    
-    return '\n\n'.join(warnings)
+    return '\n\n'.join([
+        f"{_WARNING_CODES.get(warning['warningStatementCode'], warning['warningStatementCode'])}"
+        f"{f' ({subtype})' if (subtype := warning.get('subtype')) else ''}"
+        f" - {warning['updateTime']}: {' '.join(warning['contents'])}"
+        for warning in data['details']
+    ])
 
 def format_warnings_summary(warnings_data:dict) -> str:
-  final_warning_list = []
-  if len(warnings_data.items()) == 0:
-    return "No warning issued."
-  else:
-    for warning_code, warning_info in warnings_data.items():
-      warning_name = warning_info.get('name', 'Unknown')
-      action = warning_info.get('actionCode', 'Unknown')
-      issue_time = warning_info.get('issueTime', 'Unknown')
-      final_warning_list.append((f"{warning_name} ({warning_code}) - Action: {action}, Issued at: {issue_time}"))
-  return "\n".join(final_warning_list)
+    if not warnings_data:
+        return "No warning issued."
+    return "\n".join([
+        f"{warning_info.get('name', 'Unknown')} ({warning_code}) - Action: {warning_info.get('actionCode', 'Unknown')}, Issued at: {warning_info.get('issueTime', 'Unknown')}"
+        for warning_code, warning_info in warnings_data.items()
+    ])
 
 def extract_temperature_data(data):
-    if 'temperature' in data:
-        temperatures = data['temperature']['data']
-        record_time = data['temperature']['recordTime']
-        location_temp = []
-        for temp in temperatures:
-            location_temp.append(f"{temp['place']}: {temp['value']}°{temp['unit']}")
-        temp = f"Temperature readings (recorded at {record_time}):" + '\n'.join(location_temp)
-    return temp
+    if not data.get('temperature'):
+        return None
+    temperatures = data['temperature']['data']
+    record_time = data['temperature']['recordTime']
+    location_temp = [f"{temp['place']}: {temp['value']}°{temp['unit']}" for temp in temperatures]
+    return f"Temperature readings (recorded at {record_time}):\n" + '\n'.join(location_temp)
 
 def extract_rainfall_data(data):
-    if 'rainfall' in data:
-        rainfall_info = data['rainfall']
-        rainfall_data = rainfall_info['data']
-        rain_location = []
-        for rain in rainfall_data:
-            maintenance = " Under maintenance" if rain.get('main') == 'TRUE' else "False"
-            rain_location.append(f"{rain['place']}: {rain['max']}{rain['unit']} maintenance:{maintenance}")
-    return f"Rainfall data:\n {''.join(rain_location)}"
+    if not data.get('rainfall'):
+        return None
+    rainfall_data = data['rainfall']['data']
+    rain_location = [
+        f"{rain['place']}: {rain['max']}{rain['unit']} maintenance:{' Under maintenance' if rain.get('main') == 'TRUE' else 'False'}"
+        for rain in rainfall_data
+    ]
+    return "Rainfall data:\n" + '\n'.join(rain_location)
 
 def extract_humidity_data(data):
-    if 'humidity' not in data or not data.get('humidity', {}).get('data'):
-        return "Humidty data not available"
+    if not data.get('humidity') or not data['humidity'].get('data'):
+        return None
 
     humidity_info = data['humidity']['data'][0]
     record_time = data['humidity']['recordTime']
     return f"""Humidity: {humidity_info['value']} {humidity_info['unit']} at {humidity_info['place']} Recorded at: {record_time}"""
 
 def extract_uv_index(data):
-    uvinfo = data.get('uvindex', "No uv index")
-    if len(uvinfo) < 1:
-      return "No UV index"
-    else: 
-      uv_data = uvinfo['data'][0]
-      record_desc = uvinfo['recordDesc']
-      return f"""UV Index: {uv_data['value']} ({uv_data['desc']}) at {uv_data['place']} 
-        Record description: {record_desc}"""
+    # HKO sends an empty string instead of an object when there is no UV reading
+    uvinfo = data.get('uvindex')
+    if not isinstance(uvinfo, dict):
+        return None
+    uv_list = uvinfo.get('data')
+    if not uv_list:
+        return None
+    uv_data = uv_list[0]
+    return f"UV Index: {uv_data['value']} ({uv_data['desc']}) at {uv_data['place']} Record description: {uvinfo.get('recordDesc', '')}"
+
 
+# Extractors for the current weather report, in output order
+_RHRREAD_EXTRACTORS = (
+    extract_temperature_data,
+    extract_rainfall_data,
+    extract_humidity_data,
+    extract_uv_index
+)
 
 def current_weather_process(data):
     """Process and Extrate all weather info"""
-    weather_info = [extract_temperature_data(data), extract_rainfall_data(data), extract_humidity_data(data), extract_uv_index(data)]
+    # Each extractor returns None when its section is absent
+    weather_info = [info for extract in _RHRREAD_EXTRACTORS if (info := extract(data)) is not None]
+    if not weather_info:
+        return "No current weather data available"
     return "\n".join(weather_info)
 
 
-def formatting_weather(weather_data: dict, dataType:str) -> str:
-    """Format weather into a readable string."""
-    
-    if dataType == "flw":
-        return f"""
-        General Situation: {weather_data.get("generalSituation", "Unknown")}
-        tcInfo: {weather_data.get("tcInfo", "Unkown")}
-        fireDangerWarning: {weather_data.get("fireDangerWarning", "No fire Danger")}
-        forecastPeriod: {weather_data.get("forecastPeriod", "Forecast Period not provided")}
-        forecastDesc: {weather_data.get("forecastDesc", "No forecast description available")}
-        outlook: {weather_data.get("outlook", "No outlook available")}
-        updateTime: {weather_data.get("updateTime", "No update time available")}
-        """
-    elif dataType == "fnd":
-        weekly_weather_list = weather_data["weatherForecast"]
-        weekly_weather = "\n".join(
-            f"{day['week']} ({day['forecastDate']}): {day['forecastWeather']}, {day['forecastMintemp']['value']}-{day['forecastMaxtemp']['value']}\
+# (label, key, default) rows for the local weather forecast
+_FLW_FIELDS = (
+    ("General Situation", "generalSituation", "Unknown"),
+    ("tcInfo", "tcInfo", "Unkown"),
+    ("fireDangerWarning", "fireDangerWarning", "No fire Danger"),
+    ("forecastPeriod", "forecastPeriod", "Forecast Period not provided"),
+    ("forecastDesc", "forecastDesc", "No forecast description available"),
+    ("outlook", "outlook", "No outlook available"),
+    ("updateTime", "updateTime", "No update time available")
+)
+
+def _format_flw(weather_data: dict) -> str:
+    return "\n".join([f"{label}: {weather_data.get(key, default)}" for label, key, default in _FLW_FIELDS])
+
+def _format_fnd(weather_data: dict) -> str:
+    weekly_weather_list = weather_data["weatherForecast"]
+    return "\n".join([
+        f"{day['week']} ({day['forecastDate']}): {day['forecastWeather']}, {day['forecastMintemp']['value']}-{day['forecastMaxtemp']['value']}\
             {day['forecastMaxtemp']['unit']}"
-            for day in weekly_weather_list
-        )
-        return weekly_weather
-    elif dataType == "rhrread":
-        return current_weather_process(weather_data)
-    elif dataType == "warnsum":
-        return format_warnings_summary(weather_data)
-    elif dataType == "warningInfo":
-        return format_warnings(weather_data)
-    elif dataType == "swt":
-        special_weather_tips_list = weather_data["swt"]
-        special_weather_tips = "\n".join(
-        f"{tips.get('updateTime', 'time unknown')}: {tips.get('desc', 'no description')}" 
+        for day in weekly_weather_list
+    ])
+
+def _format_swt(weather_data: dict) -> str:
+    special_weather_tips_list = weather_data["swt"]
+    return "\n".join([
+        f"{tips.get('updateTime', 'time unknown')}: {tips.get('desc', 'no description')}"
         for tips in special_weather_tips_list
-        )
-        return special_weather_tips
-   
+    ])
 
+# Formatter for each dataType
+_FORMATTERS = {
+    "flw": _format_flw,
+    "fnd": _format_fnd,
+    "rhrread": current_weather_process,
+    "warnsum": format_warnings_summary,
+    "warningInfo": format_warnings,
+    "swt": _format_swt
+}
+
+def formatting_weather(weather_data: dict, dataType:str) -> str:
+    """Format weather into a readable string."""
+    return _FORMATTERS[dataType](weather_data)
+
+
+async def _fetch_weather(dataType: str, lang: str) -> str:
+    """Fetch and format one HKO dataset, caching successful results"""
+    now = time.monotonic()
+    url = _URLS[(dataType, lang)]
+    logger.debug("Requesting URL: %s", url)
+    data = await make_hko_weather_request(url)
+
+    if data is None:
+        return "Data is None"
+    result = formatting_weather(data, dataType)
+    _CACHE[(dataType, lang)] = (now, result)
+    return result
 
 
 @mcp.tool()
-async def get_weather(dataType: str, lang:str) -> str:
+async def get_weather(dataType: DataType, lang: Lang) -> str:
     """Get Weather from Hong Kong Obvervatory. 
 
     Args:
@@ -202,24 +292,21 @@ async def get_weather(dataType: str, lang:str) -> str:
         "sc": "simplified Chinese"
         }
     """
-    dataType_set = {"flw", "fnd", "rhrread", "warnsum", "warningInfo", "swt"}
-    lang_set = {"en", "tc", "sc"}
-
-    if dataType not in dataType_set or lang not in lang_set:
-        return f"Invalid dataType or lang. Use dataType in {dataType_set} and {lang_set}"
-    else:
-        url = f"{HKO_API_BASE}?dataType={dataType}&lang={lang}"
-        print(f"Requesting URL: {url}")
-        data = await make_hko_weather_request(url)
-        
-        if data is None:
-            return "Data is None"
-        else:
-            return formatting_weather(data, dataType) # if data else "Request failed"
+    key = (dataType, lang)
+    cached = _CACHE.get(key)
+    if cached is not None and time.monotonic() - cached[0] < _TTL[dataType]:
+        return cached[1]
+
+    task = _INFLIGHT.get(key)
+    if task is None:
+        # Run the fetch as its own task so cancelling any one caller leaves it running for the rest
+        task = asyncio.create_task(_fetch_weather(dataType, lang))
+        _INFLIGHT[key] = task
+        task.add_done_callback(lambda _: _INFLIGHT.pop(key, None))
+    return await asyncio.shield(task)
 
 def main():
     """Main entry point for the server."""
-    import logging
     logging.basicConfig(level=logging.DEBUG)
     # Initialize and run the server
     mcp.run(transport='stdio')